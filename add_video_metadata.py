@@ -1,23 +1,29 @@
 import sys
 import os
-import glob
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox
 )
-from PySide6.QtMultimediaWidgets import QVideoWidget
-from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PySide6.QtCore import QUrl, QDateTime
 from datetime import datetime
 import shutil
 
 class VideoDateTagger(QWidget):
     def __init__(self, directory):
+        # Multimedia modules are slow to load; importing them here lets the
+        # directory dialog open first (and skips them if it is cancelled)
+        from PySide6.QtMultimediaWidgets import QVideoWidget
+        from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
+
         super().__init__()
         self.setWindowTitle("Video Date Tagger")
         self.resize(800, 600)
 
         self.directory = directory
-        self.video_files = sorted(glob.glob(os.path.join(directory, "*.mp4")))
+        # One scandir pass; file types come from the directory listing (hidden files skipped like glob)
+        self.video_files = sorted(
+            e.path for e in os.scandir(directory)
+            if e.is_file() and not e.name.startswith('.') and e.name.lower().endswith('.mp4')
+        )
         self.index = 0
         self.counter = 0
 
@@ -61,8 +67,9 @@ class VideoDateTagger(QWidget):
             QMessageBox.critical(self, "Error", "Invalid date format. Use YYYY-MM-DD.")
             return
 
-        # New filename and full path
-        new_filename = f"{date_str.replace('-', '_')}_{self.counter}.mp4"
+        # New filename and full path (built from the parsed date, so "2024-1-5" is zero-padded too)
+        file_date = date_obj.strftime("%Y_%m_%d")
+        new_filename = f"{file_date}_{self.counter}.mp4"
         new_path = os.path.join(self.directory, new_filename)
 
         try:
@@ -1,19 +1,25 @@
+import json
+import math
 import os
 import shutil
 import subprocess
 from datetime import datetime
 from collections import defaultdict
-import piexif
-import shlex
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
 
 # ==============================================
 # Configuration
 # ==============================================
-PHOTO_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
-VIDEO_EXTENSIONS = {
+PHOTO_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png'})
+VIDEO_EXTENSIONS = frozenset({
     '.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mpg', '.mpeg',
     '.m4v', '.3gp', '.3g2', '.ts', '.mts', '.m2ts', '.vob'
-}
+})
 
 INPUT_DIR = '/home/jessiesellars/Pictures/Laurie_cam_dec'
 OUTPUT_DIR = '/home/jessiesellars/Pictures/output'
@@ -21,8 +27,23 @@ OUTPUT_DIR = '/home/jessiesellars/Pictures/output'
 # Mode options: "photo", "video", or "both"
 MODE = "photo"
 
-# Global dict to track counts per day for naming
-date_counters = defaultdict(int)
+# ioctl from linux/fs.h: clone a file's blocks (reflink) on CoW filesystems like Btrfs/XFS
+FICLONE = 0x40049409
+
+# Worker counts: videos run in a process pool, photo copies in a thread pool
+VIDEO_WORKERS = os.cpu_count()
+PHOTO_WORKERS = None  # None lets ThreadPoolExecutor pick its default
+
+# Every ffmpeg run starts with these: many run in parallel from the pool, so none may
+# read the terminal's stdin, and per-process progress lines would interleave
+FFMPEG_CMD = ["ffmpeg", "-nostdin", "-loglevel", "error", "-nostats"]
+
+# Audio codecs the MP4 container holds as-is; anything else is re-encoded to AAC
+MP4_AUDIO_CODECS = frozenset({'aac', 'mp3'})
+
+# Upper bound on stream-copy remuxes handed to a single ffmpeg process; batches
+# are sized so every video worker gets work before files are grouped
+REMUX_BATCH_SIZE = 16
 
 # ==============================================
 # Utility Functions
@@ -32,127 +53,205 @@ def ensure_dir(path):
     if not os.path.exists(path):
         os.makedirs(path)
 
+def get_mtime_datetime(path):
+    """Returns the file modification time (mtime) as a datetime."""
+    return datetime.fromtimestamp(os.path.getmtime(path))
+
+def parse_exif_datetime(date_str):
+    """
+    Parses an EXIF "YYYY:MM:DD HH:MM:SS" string by slicing, avoiding strptime's
+    per-call format parsing and locale lookups. Raises ValueError if malformed.
+    """
+    fields = (date_str[0:4], date_str[5:7], date_str[8:10],
+              date_str[11:13], date_str[14:16], date_str[17:19])
+    if (len(date_str) != 19
+            or date_str[4] != ":" or date_str[7] != ":" or date_str[10] != " "
+            or date_str[13] != ":" or date_str[16] != ":"
+            or not all(field.isdigit() for field in fields)):
+        # int() alone would accept signs and spaces that strptime rejected
+        raise ValueError(f"Unexpected EXIF date format: {date_str!r}")
+    return datetime(*map(int, fields))
+
 def get_photo_datetime(path):
     """
     Attempts to get datetime from EXIF data. Falls back to file modification time.
     Uses specific error handling to prevent display issues.
     """
-    # Default to file modification time (mtime)
-    ts = os.path.getmtime(path)
-    fallback_dt = datetime.fromtimestamp(ts)
+    # Imported here so video-only runs never load Pillow
+    from PIL import ExifTags, Image, UnidentifiedImageError
 
     try:
-        # Attempt to load EXIF data
-        exif_dict = piexif.load(path)
-        date_str = exif_dict["0th"].get(piexif.ImageIFD.DateTime)
-        
+        # Attempt to load EXIF data; Image.open only parses headers, no pixel data is decoded
+        with Image.open(path) as im:
+            date_str = im.getexif().get(ExifTags.Base.DateTime)
+
         if date_str:
             # If EXIF is found, use it
-            return datetime.strptime(date_str.decode(), "%Y:%m:%d %H:%M:%S")
-    
-    except piexif.Invalidbox as e:
-        # Catch specific EXIF errors
-        print(f"Warning: Invalid EXIF data in photo {path}. Falling back to mtime. Error: {e}")
+            return parse_exif_datetime(date_str)
+
+    except UnidentifiedImageError as e:
+        # Catch files Pillow can't identify as an image
+        print(f"Warning: Invalid image data in photo {path}. Falling back to mtime. Error: {e}")
     except Exception as e:
-        # Catch other general errors (e.g., corrupted file that piexif can't handle)
+        # Catch other general errors (e.g., corrupted or malformed EXIF)
         print(f"Warning: General error reading EXIF from photo {path}. Falling back to mtime. Error: {e}")
 
-    # Fallback to modification time
-    return fallback_dt
+    # Fallback to modification time (only stat'ed when EXIF has no date)
+    return get_mtime_datetime(path)
 
-def get_video_datetime(path):
+def probe(path):
     """
-    Attempts to get datetime from video metadata using ffprobe. Falls back to mtime.
+    Runs ffprobe once and returns the parsed JSON with the creation_time tag and
+    per-stream codec info. Only container headers are needed, so probing is kept
+    minimal instead of scanning packets.
     """
-    # Default to file modification time (mtime)
-    ts = os.path.getmtime(path)
-    fallback_dt = datetime.fromtimestamp(ts)
+    return json.loads(subprocess.check_output([
+        "ffprobe", "-v", "error",
+        "-probesize", "32k", "-analyzeduration", "0", "-fflags", "+fastseek",
+        "-print_format", "json",
+        "-show_entries", "format_tags=creation_time:stream=codec_type,codec_name",
+        path
+    ]))
 
-    probe_cmd = (
-        f"ffprobe -v error -select_streams v:0 -show_entries format_tags=creation_time "
-        f"-of default=noprint_wrappers=1:nokey=1 {shlex.quote(path)}"
-    )
-    
+def get_video_datetime(path, info):
+    """
+    Gets datetime from the creation_time tag of a probe() result. Falls back to mtime.
+    """
+    creation_time_str = info.get("format", {}).get("tags", {}).get("creation_time", "").strip()
+    if creation_time_str:
+        # Attempt to parse creation time (format can vary, ISO is common)
+        # Example format: 2023-12-14T10:30:00.000000Z
+        try:
+            # Common ISO format parsing
+            return datetime.fromisoformat(creation_time_str.replace('Z', '+00:00'))
+        except ValueError:
+            # If ISO parsing fails, fall back gracefully
+            print(f"Warning: Could not parse video creation time '{creation_time_str}'. Using mtime.")
+
+    return get_mtime_datetime(path)
+
+def get_audio_codec(info):
+    """Returns the codec name of the first audio stream in a probe() result, or "unknown"."""
+    audio = [s for s in info.get("streams", []) if s.get("codec_type") == "audio"]
+    if audio:
+        return audio[0].get("codec_name", "unknown")
+    return "unknown"
+
+def get_video_metadata(path):
+    """
+    Probes the video once and returns (datetime, audio_codec).
+    A failed probe falls back to mtime and an "unknown" codec.
+    """
     try:
-        creation_time_str = subprocess.check_output(probe_cmd, shell=True).decode().strip()
-        if creation_time_str:
-            # Attempt to parse creation time (format can vary, ISO is common)
-            # Example format: 2023-12-14T10:30:00.000000Z
-            try:
-                # Common ISO format parsing
-                return datetime.fromisoformat(creation_time_str.replace('Z', '+00:00'))
-            except ValueError:
-                # If ISO parsing fails, fall back gracefully
-                print(f"Warning: Could not parse video creation time '{creation_time_str}'. Using mtime.")
-        
+        info = probe(path)
     except subprocess.CalledProcessError:
-        # ffprobe failed or tag not present
-        pass
+        # ffprobe failed
+        info = {}
     except Exception as e:
         print(f"Warning: Error during ffprobe for video {path}: {e}. Falling back to mtime.")
-    
-    return fallback_dt
+        info = {}
 
+    return get_video_datetime(path, info), get_audio_codec(info)
 
-def generate_name_with_counter(dt, ext):
-    """Generates a date-based filename with a sequential counter."""
-    date_str = dt.strftime("%Y_%m_%d")
-    # Increment the counter for this date
-    date_counters[date_str] += 1
-    counter = date_counters[date_str]
-    return f"{date_str}_{counter:03d}{ext}" # Added :03d for better sorting
+
+def assign_names(entries, dst_dir):
+    """
+    Generates date-based destination paths with a sequential counter per day.
+    entries is a list of (src, dt, ext); files are numbered in chronological
+    order so the result does not depend on walk or worker ordering.
+    Returns a list of (src, dst_path) tuples.
+    """
+    # Group by day, then order by time within the day (tz dropped so naive EXIF
+    # dates and UTC video dates compare)
+    keyed = sorted(
+        (dt.strftime("%Y_%m_%d"), dt.replace(tzinfo=None), src, ext) for src, dt, ext in entries
+    )
+    date_counters = defaultdict(int)
+    named = []
+    for date_str, _, src, ext in keyed:
+        # Increment the counter for this date
+        date_counters[date_str] += 1
+        counter = date_counters[date_str]
+        dst_name = f"{date_str}_{counter:03d}{ext}" # Added :03d for better sorting
+        named.append((src, os.path.join(dst_dir, dst_name)))
+    return named
 
 # ==============================================
 # Photo & Video Processing (Modified)
 # ==============================================
-def copy_photo(src, dst_dir):
+def clone_or_copy(src, dst_path):
+    """
+    Reflinks src to dst_path when the filesystem supports it (blocks are
+    shared, no data is copied); otherwise falls back to shutil.copy2.
+    A hardlink is not used, as later utime calls would also change the source.
+    """
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as fsrc, open(dst_path, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst_path)
+            return
+        except OSError:
+            # Unsupported filesystem or cross-device; copy2 overwrites the empty file
+            pass
+    shutil.copy2(src, dst_path)
+
+def copy_photo(src, dst_path, dt):
     """
-    Copies the photo using the date determined by get_photo_datetime().
+    Copies the photo to dst_path (named from get_photo_datetime() by assign_names)
+    and sets its access/modification time to dt.
     The copy operation is separate from the date extraction.
     """
-    # Get the date/time (robustly handled in get_photo_datetime)
-    dt = get_photo_datetime(src)
-    ext = os.path.splitext(src)[1].lower()
-    
-    # Generate the destination path
-    dst_name = generate_name_with_counter(dt, ext)
-    dst_path = os.path.join(dst_dir, dst_name)
-    
     # Perform the copy operation
-    shutil.copy2(src, dst_path)
+    clone_or_copy(src, dst_path)
+    timestamp = dt.timestamp()
+    os.utime(dst_path, (timestamp, timestamp))
     print(f"-> Copied to: {dst_path}")
     
     return dst_path
 
-def convert_video(src, dst_dir):
-    """Converts the video to MP4 using FFmpeg and determines date robustly."""
-    
-    # Get the date/time (uses ffprobe metadata or mtime)
-    dt = get_video_datetime(src)
-    ext = ".mp4"
-    
-    # Generate the destination path
-    dst_name = generate_name_with_counter(dt, ext)
-    dst_path = os.path.join(dst_dir, dst_name)
+def is_copy_only(src, audio_codec):
+    """True if the video is already MP4 with MP4-compatible audio and can be copied as-is."""
+    return os.path.splitext(src)[1].lower() == ".mp4" and audio_codec in MP4_AUDIO_CODECS
 
-    # Detect audio codec for smart conversion
-    probe_cmd = f"ffprobe -v error -select_streams a:0 -show_entries stream=codec_name -of default=noprint_wrappers=1:nokey=1 {shlex.quote(src)}"
-    try:
-        audio_codec = subprocess.check_output(probe_cmd, shell=True).decode().strip()
-    except subprocess.CalledProcessError:
-        audio_codec = "unknown"
+def stream_maps(i):
+    """
+    Stream selection shared by every FFmpeg run, so a video comes out the same
+    whether it was converted alone or in a batch: the first video and first
+    audio stream of input i, plus its metadata and chapters. Subtitle and data
+    streams are dropped.
+    """
+    return [
+        "-map", f"{i}:v:0?", "-map", f"{i}:a:0?",
+        "-map_metadata", str(i), "-map_chapters", str(i),
+    ]
+
+def convert_video(src, dst_path, audio_codec):
+    """
+    Converts the video to MP4 at dst_path using FFmpeg, keeping the streams
+    chosen by stream_maps().
+    audio_codec comes from get_video_metadata() so no extra probe is needed.
+    MP4 files that already carry AAC/MP3 audio are copied as-is, skipping FFmpeg.
+    """
+
+    # Already compliant: a remux would only reproduce the same streams
+    if is_copy_only(src, audio_codec):
+        clone_or_copy(src, dst_path)
+        print(f"-> Copied to: {dst_path}")
+        return dst_path
 
     # Build ffmpeg command
-    cmd = [
-        "ffmpeg", "-i", src,
-        "-map_metadata", "0",
+    cmd = FFMPEG_CMD + ["-i", src] + stream_maps(0) + [
         "-c:v", "copy",
         "-movflags", "+faststart",
     ]
 
-    # Convert audio to AAC if not already AAC, otherwise copy
-    if audio_codec != "aac":
-        cmd += ["-c:a", "aac", "-b:a", "192k"]
+    # Convert audio to AAC if MP4 can't hold it, otherwise copy.
+    # -aac_coder fast trades some quality for speed over the default twoloop coder;
+    # -threads 0 (auto) is already FFmpeg's default and the native aac encoder is
+    # single-threaded, so it only makes the setting explicit
+    if audio_codec not in MP4_AUDIO_CODECS:
+        cmd += ["-c:a", "aac", "-aac_coder", "fast", "-b:a", "192k", "-threads", "0"]
     else:
         cmd += ["-c:a", "copy"]
 
@@ -162,37 +261,170 @@ def convert_video(src, dst_dir):
     print(f"-> Converted to: {dst_path}")
     return dst_path
 
+def remux_batch(jobs):
+    """
+    Remuxes several videos [(src, dst_path, audio_codec), ...] whose audio MP4
+    can hold as-is to MP4 in one FFmpeg run,
+    so process startup is paid once per batch instead of once per file.
+    Input i is mapped only to output i via stream_maps(i), the same selection
+    convert_video() uses.
+    """
+    cmd = list(FFMPEG_CMD)
+    for src, _, _ in jobs:
+        cmd += ["-i", src]
+    for i, (_, dst_path, _) in enumerate(jobs):
+        cmd += stream_maps(i) + [
+            "-c:v", "copy", "-c:a", "copy",
+            "-movflags", "+faststart",
+            dst_path,
+        ]
+
+    subprocess.run(cmd, check=True)
+    for _, dst_path, _ in jobs:
+        print(f"-> Converted to: {dst_path}")
+
 # ==============================================
 # Processing Logic
 # ==============================================
-def process_file(path, output_dir):
-    """Routes files to the appropriate processor based on extension and MODE."""
-    ext = os.path.splitext(path)[1].lower()
+def _process_photo(path, dst_path, dt):
+    """Copies a single photo, reporting errors instead of raising (runs in a worker thread)."""
+    print(f"\nCopying photo: {path}")
+    try:
+        copy_photo(path, dst_path, dt)
+    except Exception as e:
+        print(f"FATAL Error copying photo {path}: {e}")
 
-    if ext in PHOTO_EXTENSIONS and MODE in ("photo", "both"):
-        print(f"\nCopying photo: {path}")
-        try:
-            copy_photo(path, output_dir)
-        except Exception as e:
-            print(f"FATAL Error copying photo {path}: {e}")
+def _process_video(path, dst_path, audio_codec):
+    """Converts a single video, reporting errors instead of raising (runs in a worker process)."""
+    print(f"\nProcessing video: {path}")
+    try:
+        convert_video(path, dst_path, audio_codec)
+    except subprocess.CalledProcessError as e:
+        print(f"FATAL Error converting video {path} (FFmpeg failed): {e}")
+    except Exception as e:
+        print(f"FATAL Error converting video {path}: {e}")
 
-    elif ext in VIDEO_EXTENSIONS and MODE in ("video", "both"):
-        print(f"\nProcessing video: {path}")
-        try:
-            convert_video(path, output_dir)
-        except subprocess.CalledProcessError as e:
-            print(f"FATAL Error converting video {path} (FFmpeg failed): {e}")
-        except Exception as e:
-            print(f"FATAL Error converting video {path}: {e}")
+def _process_video_batch(jobs):
+    """
+    Remuxes a batch of (src, dst_path, audio_codec) videos in one FFmpeg run (runs in a worker
+    process). If the batch fails, each video is retried on its own so one bad
+    file doesn't take the others down with it. Outputs that already existed
+    before the batch are never removed, matching the single-file path.
+    """
+    print(f"\nRemuxing {len(jobs)} videos: {', '.join(src for src, _, _ in jobs)}")
+    existing = {dst_path for _, dst_path, _ in jobs if os.path.exists(dst_path)}
+    try:
+        remux_batch(jobs)
+    except Exception as e:
+        print(f"Warning: Batch remux failed ({e}). Retrying videos one by one.")
+        # FFmpeg creates every output before writing any headers, so a failed
+        # batch leaves files behind that the retries would refuse to overwrite.
+        # Only files this batch created are removed
+        for _, dst_path, _ in jobs:
+            if dst_path not in existing and os.path.exists(dst_path):
+                os.remove(dst_path)
+        for job in jobs:
+            _process_video(*job)
+
+def scan_files(directory, extensions):
+    """
+    Recursively yields (path, ext) for every regular file under directory whose
+    lowercased extension is in extensions; other files are skipped right away.
+    os.scandir gives the file type from the directory listing, so no extra
+    stat or path join is needed per entry. Directory symlinks are not followed.
+    Unreadable directories are skipped with a warning, as os.walk did.
+    """
+    try:
+        it = os.scandir(directory)
+    except OSError as e:
+        print(f"Warning: Could not read directory {directory}. Skipping it. Error: {e}")
+        return
+
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan_files(entry.path, extensions)
+            elif entry.is_file():
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in extensions:
+                    yield entry.path, ext
+
+def collect_files(input_dir):
+    """Scans the input directory and returns (photo_paths, video_paths) selected by MODE."""
+    photo_paths, video_paths = [], []
+
+    # Map each wanted extension straight to its list, so MODE is checked once
+    dispatch = {}
+    if MODE in ("photo", "both"):
+        dispatch.update(dict.fromkeys(PHOTO_EXTENSIONS, photo_paths))
+    if MODE in ("video", "both"):
+        dispatch.update(dict.fromkeys(VIDEO_EXTENSIONS, video_paths))
+
+    for path, ext in scan_files(input_dir, dispatch):
+        dispatch[ext].append(path)
+    return photo_paths, video_paths
+
+def read_dates(photo_paths, video_paths):
+    """
+    Reads every file's date in one pass (EXIF reads and one ffprobe call per
+    video, both I/O bound, so a thread pool is used).
+    Returns (entries, audio_codecs): entries is a list of (src, dt, ext) for
+    assign_names(), audio_codecs is a list parallel to video_paths.
+    """
+    with ThreadPoolExecutor() as ex:
+        photo_dts = list(ex.map(get_photo_datetime, photo_paths))
+        video_meta = list(ex.map(get_video_metadata, video_paths))
+
+    entries = [(p, dt, os.path.splitext(p)[1].lower()) for p, dt in zip(photo_paths, photo_dts)]
+    entries += [(v, dt, ".mp4") for v, (dt, _) in zip(video_paths, video_meta)]
+    return entries, [codec for _, codec in video_meta]
 
 def recurse_and_process(input_dir, output_dir):
-    """Walks the input directory and processes each file."""
+    """
+    Processes the input directory in three phases: collect files and read
+    their dates, assign every destination name up front, then run videos in
+    a process pool and photo copies in a thread pool.
+    """
     ensure_dir(output_dir)
     print(f"Starting processing from {input_dir}...")
-    for root, _, files in os.walk(input_dir):
-        for file in files:
-            full_path = os.path.join(root, file)
-            process_file(full_path, output_dir)
+
+    # Phase 1: walk the tree and read dates
+    photo_paths, video_paths = collect_files(input_dir)
+    entries, audio_codecs = read_dates(photo_paths, video_paths)
+
+    # Phase 2: pre-compute destination paths with per-day counters
+    named = dict(assign_names(entries, output_dir))
+    dates = {src: dt for src, dt, _ in entries}
+
+    # Stream-copy remuxes are batched into shared FFmpeg runs; copies, audio
+    # re-encodes and videos whose destination already exists (which FFmpeg will
+    # refuse, failing a whole batch) stay one job per file
+    remux_jobs, single_jobs = [], []
+    for src, audio_codec in zip(video_paths, audio_codecs):
+        job = (src, named[src], audio_codec)
+        if (audio_codec in MP4_AUDIO_CODECS and not is_copy_only(src, audio_codec)
+                and not os.path.exists(named[src])):
+            remux_jobs.append(job)
+        else:
+            single_jobs.append(job)
+    # Spread remuxes over every worker first; only group files once there are
+    # more than workers (one FFmpeg process may handle all its inputs on one thread)
+    batch_size = max(1, min(REMUX_BATCH_SIZE, math.ceil(len(remux_jobs) / (VIDEO_WORKERS or 1))))
+    remux_batches = [
+        remux_jobs[i:i + batch_size] for i in range(0, len(remux_jobs), batch_size)
+    ]
+
+    # Phase 3: copy/convert with no shared naming state between workers
+    with ProcessPoolExecutor(max_workers=VIDEO_WORKERS) as video_ex, \
+            ThreadPoolExecutor(max_workers=PHOTO_WORKERS) as photo_ex:
+        video_jobs = [video_ex.submit(_process_video_batch, batch) for batch in remux_batches]
+        video_jobs += [video_ex.submit(_process_video, *job) for job in single_jobs]
+        photo_jobs = photo_ex.map(
+            _process_photo, photo_paths, [named[p] for p in photo_paths], [dates[p] for p in photo_paths]
+        )
+        list(photo_jobs)
+        for job in video_jobs:
+            job.result()
     print("\nProcessing complete.")
 
 # ==============================================